@@ -1,7 +1,12 @@
-from flask import Flask, jsonify
+import datetime
+import os
+from contextlib import contextmanager
+
+from flask import Flask, g, jsonify
 from flask_json_errorhandler import init_errorhandler
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.pool import StaticPool
 # Instantiate Flask extensions
 from pydantic import ValidationError
 
@@ -11,6 +16,21 @@ db = SQLAlchemy()
 migrate = Migrate()
 
 
+@contextmanager
+def atomic():
+    """
+    Run a block of session work as one transaction: lookups, inserts and
+    updates inside the block share a single commit on success, and the
+    whole block is rolled back on any error.
+    """
+    try:
+        yield db.session
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
 def create_app(extra_config_settings=None):
     """Create a Flask application.
     """
@@ -20,6 +40,11 @@ def create_app(extra_config_settings=None):
 
     app = Flask(__name__)
 
+    @app.before_request
+    def stamp_request_time():
+        # one clock read per request; validators and the like reuse it
+        g.request_now = datetime.datetime.utcnow()
+
     @app.errorhandler(InvalidUsage)
     def app_error_handler(e: InvalidUsage):
         return jsonify({"errors": e.errors()}), e.code
@@ -37,6 +62,22 @@ def create_app(extra_config_settings=None):
     # Load extra settings from extra_config_settings param
     app.config.update(extra_config_settings)
 
+    # Configure an explicit connection pool, unless settings already did
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        if app.config.get('SQLALCHEMY_DATABASE_URI', '').startswith('sqlite'):
+            # SQLite (dev/tests) shares one connection across threads
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+                'poolclass': StaticPool,
+                'connect_args': {'check_same_thread': False},
+            }
+        else:
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+                'pool_size': int(os.environ.get('DB_POOL_SIZE', 25)),
+                'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 25)),
+                'pool_pre_ping': True,
+                'pool_recycle': 1800,
+            }
+
     # Setup Flask-SQLAlchemy
     db.init_app(app)
 
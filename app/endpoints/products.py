@@ -1,14 +1,46 @@
-from typing import Dict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-from flask import Blueprint, jsonify, request
+import orjson
+from flask import Blueprint, jsonify, request, Response, stream_with_context
+from pydantic import parse_obj_as
+from werkzeug.http import http_date
 
-from app import db
-from app.models.products import Product, Brand, Category
+from app import atomic, db
+from app.models.exceptions import InvalidUsage, NotFound
+from app.models.products import Product, Brand, Category, data_revision, products_categories
 from app.schema.products import ProductCreateRequest, ProductUpdateRequest
 
 products_blueprint = Blueprint('products', __name__)
 
 
+def _json_default(value):
+    """
+    Serialize types orjson does not handle natively.
+    Dates keep the RFC 1123 format jsonify used to produce.
+    """
+    if isinstance(value, datetime):
+        return http_date(value)
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+def _json_dumps(payload) -> bytes:
+    return orjson.dumps(payload, default=_json_default,
+                        option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def _json_response(payload, status: int = 200) -> Response:
+    """
+    Build an application/json response via orjson, bypassing jsonify.
+
+    @param payload: JSON-serializable response body (or pre-dumped bytes)
+    @param status: HTTP status code
+    @return: Flask response with JSON body.
+    """
+    body = payload if isinstance(payload, bytes) else _json_dumps(payload)
+    return Response(body, status=status, mimetype='application/json')
+
+
 def build_product_args(data: ProductUpdateRequest) -> Dict:
     """
     Turn ProductSchema into dict for updating Product orm object.
@@ -18,26 +50,103 @@ def build_product_args(data: ProductUpdateRequest) -> Dict:
     @param data: request data ProductCreateRequest
     @return: dict with data
     """
-    create_args = data.dict(exclude_unset=True)
+    # equivalent of data.dict(exclude_unset=True) without pydantic's
+    # validator-aware deep copy; every field here is a plain value
+    create_args = {field: getattr(data, field) for field in data.__fields_set__}
+
+    # one round-trip resolves both reference kinds
+    brand, categories = Product.resolve_refs(data.brand, data.categories)
 
     if data.brand is not None:
-        create_args["brand"] = Brand.get(data.brand)
+        create_args["brand"] = brand
 
     if data.categories is not None:
-        create_args["categories"] = Category.get_all(data.categories)
+        create_args["categories"] = categories
 
     return create_args
 
 
+# One-slot cache of the fully rendered list body, keyed on table revision.
+_products_body_cache: Tuple[Optional[int], bytes] = (None, b'')
+
+
+def _stream_products_body(revision: int):
+    """
+    Generate the product list JSON in per-row chunks, so the response
+    starts flowing before the whole catalog is rendered. Every chunk is
+    also accumulated and, once fully sent, the joined bytes are cached
+    for the given table revision -- this trades memory (roughly twice
+    the body while streaming) for time-to-first-byte and cache reuse.
+
+    Rows are fetched as column tuples (three queries total) rather than
+    as ORM instances: the listing only reads serialized fields, so
+    instance construction and identity-map bookkeeping would be wasted.
+
+    @param revision: current data_revision(), used as cache key
+    @return: iterator of response body chunks
+    """
+    global _products_body_cache
+
+    chunks = [b'{"results": [']
+    yield chunks[0]
+
+    brands = {
+        brand_id: {'id': brand_id, 'name': name, 'country_code': country_code}
+        for brand_id, name, country_code in
+        db.session.query(Brand.id, Brand.name, Brand.country_code)
+    }
+
+    categories = {}
+    category_rows = db.session.query(
+        products_categories.c.product_id, Category.id, Category.name
+    ).filter(products_categories.c.category_id == Category.id)
+    for product_id, category_id, name in category_rows:
+        categories.setdefault(product_id, []).append({'id': category_id, 'name': name})
+
+    first = True
+    product_rows = db.session.query(*Product.list_view_cols).yield_per(500)
+    for (product_id, name, rating, featured, items_in_stock, receipt_date,
+         expiration_date, created_at, brand_id) in product_rows:
+        chunk = _json_dumps({
+            'id': product_id,
+            'name': name,
+            'rating': rating,
+            'featured': featured,
+            'items_in_stock': items_in_stock,
+            'receipt_date': receipt_date,
+            'brand': brands[brand_id],
+            'categories': categories.get(product_id, []),
+            'expiration_date': expiration_date,
+            'created_at': created_at
+        })
+        if not first:
+            chunk = b', ' + chunk
+        first = False
+
+        chunks.append(chunk)
+        yield chunk
+
+    closing = b']}'
+    chunks.append(closing)
+    yield closing
+
+    _products_body_cache = (revision, b''.join(chunks))
+
+
 @products_blueprint.route('/products', methods=['GET'])
 def get_products():
     """
     Get full list of products.
     @return: List of product representations.
     """
-    return jsonify({
-        'results': [p.serialized for p in Product.query.all()]
-    })
+    revision = data_revision()
+
+    cached_revision, body = _products_body_cache
+    if cached_revision == revision:
+        return _json_response(body)
+
+    return Response(stream_with_context(_stream_products_body(revision)),
+                    mimetype='application/json')
 
 
 @products_blueprint.route('/products', methods=['POST'])
@@ -48,15 +157,68 @@ def create_product():
     @see ProductCreateRequest for request body fields.
     @return: Created product representation.
     """
-    create_input = ProductCreateRequest(**request.get_json())
+    create_input = ProductCreateRequest.parse_raw(request.get_data())
+
+    with atomic():
+        create_data = build_product_args(create_input)
+        product: Product = Product.create(create_data)
+        db.session.add(product)
+
+    return _json_response(product.serialized, status=201)
+
+
+@products_blueprint.route('/products/batch', methods=['POST'])
+def create_products_batch():
+    """
+    Create many products in one request.
 
-    create_data = build_product_args(create_input)
-    product: Product = Product.create(create_data)
+    Accepts a JSON array of product bodies (same fields as POST /products),
+    validates them all, checks every referenced brand/category in two IN
+    queries and inserts all rows through the bulk path under one commit.
 
-    db.session.add(product)
-    db.session.commit()
+    @return: IDs of created products, in request order.
+    """
+    try:
+        payload = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        raise InvalidUsage("request body is not valid JSON", 400)
+
+    create_inputs = parse_obj_as(List[ProductCreateRequest], payload)
+
+    brand_ids = {item.brand for item in create_inputs}
+    category_ids = set()
+    for item in create_inputs:
+        category_ids |= item.categories
+
+    with atomic():
+        missing = []
+
+        db_brand_ids = {
+            brand_id for (brand_id,) in
+            db.session.query(Brand.id).filter(Brand.id.in_(brand_ids))
+        }
+        missing.extend(("Brand", brand_id) for brand_id in brand_ids - db_brand_ids)
+
+        db_category_ids = {
+            category_id for (category_id,) in
+            db.session.query(Category.id).filter(Category.id.in_(category_ids))
+        }
+        missing.extend(
+            ("Category", category_id) for category_id in category_ids - db_category_ids
+        )
 
-    return jsonify(product.serialized), 201
+        if missing:
+            raise NotFound(missing)
+
+        rows = []
+        for item in create_inputs:
+            row = {field: getattr(item, field) for field in item.__fields_set__}
+            row['brand_id'] = row.pop('brand')
+            rows.append(row)
+
+        product_ids = Product.create_many(rows)
+
+    return _json_response({'ids': product_ids}, status=201)
 
 
 @products_blueprint.route('/products/<int:product_id>', methods=['GET'])
@@ -67,7 +229,7 @@ def read_product(product_id: int):
     @return: Wanted product representation.
     """
     product: Product = Product.get(product_id)
-    return jsonify(product.serialized)
+    return _json_response(product.serialized)
 
 
 @products_blueprint.route('/products/<int:product_id>', methods=['PATCH'])
@@ -80,14 +242,14 @@ def update_product(product_id: int):
     @return: Representation of product after update.
     """
 
-    update_input = ProductUpdateRequest(**request.get_json())
-    update_data = build_product_args(update_input)
+    update_input = ProductUpdateRequest.parse_raw(request.get_data())
 
-    product: Product = Product.get(product_id)
-    product.update(update_data)
-    db.session.commit()
+    with atomic():
+        update_data = build_product_args(update_input)
+        product: Product = Product.get(product_id)
+        product.update(update_data)
 
-    return jsonify(product.serialized)
+    return _json_response(product.serialized)
 
 
 @products_blueprint.route('/products/<int:product_id>', methods=['DELETE'])
@@ -98,8 +260,8 @@ def delete_product(product_id: int):
     @param product_id: ID of product we want to delete.
     @return: Simple status message.
     """
-    product: Product = Product.get(product_id)
-    db.session.delete(product)
-    db.session.commit()
+    with atomic():
+        product: Product = Product.get(product_id)
+        db.session.delete(product)
 
     return jsonify({"status": "ok"})
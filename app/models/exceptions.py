@@ -1,4 +1,4 @@
-from typing import List
+from typing import Any, List, Tuple
 
 
 class InvalidUsage(Exception):
@@ -15,5 +15,14 @@ class InvalidUsage(Exception):
 
 
 class NotFound(InvalidUsage):
-    def __init__(self, resources: List[str]):
-        super(NotFound, self).__init__(f"Resources are not found: {resources}", 404)
+    def __init__(self, resources: List[Tuple[str, Any]]):
+        # msg is formatted lazily via the property below,
+        # so raising stays free of string building
+        Exception.__init__(self)
+        self.code = 404
+        self.resources = resources
+
+    @property
+    def msg(self) -> str:
+        names = [f"{kind}[{resource_id}]" for kind, resource_id in self.resources]
+        return f"Resources are not found: {names}"
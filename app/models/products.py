@@ -1,12 +1,42 @@
 import datetime
-from typing import Set, Dict
+from typing import List, Optional, Set, Dict, Tuple
+
+from flask import g, has_request_context
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached, selectinload
 
 from app import db
 from app.models.exceptions import NotFound
+from app.models.serializers import serialize_brand, serialize_category, serialize_product
 from app.schema.products import ProductPresentation, BrandPresentation, CategoryPresentation
 
 FEATURED_THRESHOLD = 8
 
+# Compiled-statement cache for the hot lookups: each baked lambda's SQL is
+# compiled once and reused across calls (and across IN-list lengths, via
+# expanding bind parameters).
+bakery = baked.bakery()
+
+
+def _entity_cache() -> Optional[Dict]:
+    """
+    Per-request cache of resolved reference objects, keyed (model, id).
+    Deduplicates Brand/Category lookups within one POST/PATCH and across
+    the rows of a batched request. Outside a request context there is
+    nothing to scope the cache to, so None is returned and callers skip it.
+
+    @return: mutable cache dict, or None outside a request.
+    """
+    if not has_request_context():
+        return None
+
+    cache = getattr(g, '_entity_cache', None)
+    if cache is None:
+        cache = {}
+        g._entity_cache = cache
+    return cache
+
 
 class Product(db.Model):
     """
@@ -20,14 +50,21 @@ class Product(db.Model):
     featured = db.Column(db.Boolean, nullable=False, default=False)
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow)
     expiration_date = db.Column(db.DateTime, nullable=True)
 
     brand_id = db.Column(db.Integer, db.ForeignKey('brands.id'), nullable=False)
-    categories = db.relationship('Category', secondary='products_categories', backref='products')
+    brand = db.relationship('Brand', back_populates='products')
+    categories = db.relationship('Category', secondary='products_categories',
+                                 back_populates='products')
 
     items_in_stock = db.Column(db.Integer, nullable=False)
     receipt_date = db.Column(db.DateTime, nullable=True)
 
+    # Memoized presentation, keyed on (id, updated_at). Not a mapped column.
+    _serialized_cache: Optional[Tuple[Tuple, ProductPresentation]] = None
+
     def on_update(self, data: Dict):
         if data.get("featured", None) is None and data.get("rating", 0) > FEATURED_THRESHOLD:
             self.featured = True
@@ -43,6 +80,139 @@ class Product(db.Model):
         product.on_update(data)
         return product
 
+    @classmethod
+    def resolve_refs(cls, brand_id: Optional[int], category_ids: Optional[Set[int]]):
+        """
+        Resolve a brand id and a set of category ids to mapped objects with
+        a single UNION ALL round-trip instead of one SELECT per model.
+        Throws NotFound listing every missing reference at once.
+
+        References already resolved earlier in the same request are served
+        from the per-request cache and excluded from the query.
+
+        @param brand_id: ID of wanted brand, or None to skip.
+        @param category_ids: IDs of wanted categories, or None to skip.
+        @return: (brand, categories) tuple, each element None when skipped.
+        """
+        cache = _entity_cache()
+
+        brand = None
+        fetch_brand = brand_id is not None
+        if fetch_brand and cache is not None:
+            brand = cache.get((Brand, brand_id))
+            fetch_brand = brand is None
+
+        resolved_categories = {}
+        pending_categories = set(category_ids) if category_ids else set()
+        if cache is not None:
+            for category_id in tuple(pending_categories):
+                category = cache.get((Category, category_id))
+                if category is not None:
+                    resolved_categories[category_id] = category
+                    pending_categories.discard(category_id)
+
+        parts = []
+        params = {}
+
+        if fetch_brand:
+            parts.append(
+                "SELECT 'brand' AS kind, id, name, country_code "
+                "FROM brands WHERE id = :brand_id"
+            )
+            params['brand_id'] = brand_id
+
+        if pending_categories:
+            parts.append(
+                "SELECT 'category' AS kind, id, name, NULL "
+                "FROM categories WHERE id IN :category_ids"
+            )
+            params['category_ids'] = list(pending_categories)
+
+        fetched_brand = None
+        fetched_categories = {}
+
+        if parts:
+            statement = text(" UNION ALL ".join(parts))
+            if pending_categories:
+                statement = statement.bindparams(bindparam('category_ids', expanding=True))
+
+            for kind, ref_id, name, country_code in db.session.execute(statement, params):
+                if kind == 'brand':
+                    fetched_brand = Brand(id=ref_id, name=name, country_code=country_code)
+                else:
+                    fetched_categories[ref_id] = Category(id=ref_id, name=name)
+
+        missing = []
+        if fetch_brand and fetched_brand is None:
+            missing.append(("Brand", brand_id))
+        missing.extend(
+            ("Category", category_id)
+            for category_id in pending_categories.difference(fetched_categories)
+        )
+
+        if missing:
+            raise NotFound(missing)
+
+        # the rows came straight from the DB, so attach them without re-querying
+        if fetched_brand is not None:
+            make_transient_to_detached(fetched_brand)
+            brand = db.session.merge(fetched_brand, load=False)
+
+        for category_id, category in fetched_categories.items():
+            make_transient_to_detached(category)
+            resolved_categories[category_id] = db.session.merge(category, load=False)
+
+        if cache is not None:
+            if brand is not None:
+                cache[(Brand, brand_id)] = brand
+            for category_id, category in resolved_categories.items():
+                cache[(Category, category_id)] = category
+
+        categories = None
+        if category_ids:
+            categories = [resolved_categories[category_id] for category_id in category_ids]
+
+        return brand, categories
+
+    @classmethod
+    def create_many(cls, rows: List[Dict]) -> List[int]:
+        """
+        Insert many products through the bulk path, skipping per-object
+        unit-of-work overhead. Each row holds product column values plus an
+        optional 'categories' list of Category ids; association rows are
+        written with one precompiled executemany INSERT.
+
+        The backend here has no RETURNING support, so primary keys are
+        collected via return_defaults instead.
+
+        @param rows: Product data rows. Should include all needed fields.
+        @return: IDs of created products, in input order.
+        """
+        rows = [dict(row) for row in rows]
+        category_ids = [row.pop('categories', []) for row in rows]
+
+        for row in rows:
+            # mirror on_update's featured promotion for the bulk path
+            if row.get("featured", None) is None and row.get("rating", 0) > FEATURED_THRESHOLD:
+                row["featured"] = True
+
+        db.session.bulk_insert_mappings(cls, rows, return_defaults=True)
+        product_ids = [row['id'] for row in rows]
+
+        associations = [
+            {'product_id': product_id, 'category_id': category_id}
+            for product_id, ids in zip(product_ids, category_ids)
+            for category_id in ids
+        ]
+
+        if associations:
+            db.session.execute(_product_category_insert, associations)
+
+        # the bulk path skips flush events, so invalidate explicitly
+        bump_data_revision()
+
+        return product_ids
+
     @classmethod
     def get(cls, product_id: int):
         """
@@ -51,10 +221,18 @@ class Product(db.Model):
         @param product_id: ID of product we need.
         @return: Wanted product.
         """
-        product: Product = db.session.query(Product).filter_by(id=product_id).first()
+        # Query.get is the identity-map fast path: no SELECT at all when
+        # the product is already present in the session. On a miss the
+        # eager-load options pull brand (to-one, joined into the same
+        # statement) and categories (to-many, one IN query) along, so
+        # serialization never falls back to lazy loads.
+        product: Product = db.session.query(Product).options(
+            joinedload(Product.brand),
+            selectinload(Product.categories)
+        ).get(product_id)
 
         if product is None:
-            raise NotFound([f"Product[{product_id}]"])
+            raise NotFound([("Product", product_id)])
 
         return product
 
@@ -63,35 +241,44 @@ class Product(db.Model):
         Update product.
         @param data: Product data. Can be partial.
         """
-        data = {
-            key: value
-            for key, value in data.items()
-            if hasattr(self, key)
-        }
-
-        for key, value in data.items():
-            setattr(self, key, value)
+        for key in data.keys() & self._UPDATABLE:
+            setattr(self, key, data[key])
 
         self.on_update(data)
+        self._serialized_cache = None
 
     @property
     def serialized(self) -> ProductPresentation:
         """
         Get product presentation, prepared to be turned into JSON.
+        Memoized until the product changes (see `updated_at`).
         @return: Product representation.
         """
-        return {
-            'id': self.id,
-            'name': self.name,
-            'rating': self.rating,
-            'featured': self.featured,
-            'items_in_stock': self.items_in_stock,
-            'receipt_date': self.receipt_date,
-            'brand': self.brand.serialized,
-            'categories': [c.serialized for c in self.categories],
-            'expiration_date': self.expiration_date,
-            'created_at': self.created_at
-        }
+        cache_key = (self.id, self.updated_at)
+
+        cached = self._serialized_cache
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+
+        presentation = serialize_product(self)
+
+        self._serialized_cache = (cache_key, presentation)
+        return presentation
+
+
+# Keys update() is allowed to set, precomputed once so the hot loop is a
+# plain set intersection instead of per-key hasattr checks.
+Product._UPDATABLE = frozenset(
+    column.name for column in Product.__table__.columns
+) | {'brand', 'categories'}
+
+# Columns the list endpoint projects instead of full ORM instances,
+# in presentation order (brand_id last, swapped for the brand presentation).
+Product.list_view_cols = (
+    Product.id, Product.name, Product.rating, Product.featured,
+    Product.items_in_stock, Product.receipt_date, Product.expiration_date,
+    Product.created_at, Product.brand_id,
+)
 
 
 class Brand(db.Model):
@@ -104,7 +291,10 @@ class Brand(db.Model):
     name = db.Column(db.Unicode(50), nullable=False)
     country_code = db.Column(db.Unicode(2), nullable=False)
 
-    products = db.relationship('Product', backref='brand')
+    products = db.relationship('Product', back_populates='brand')
+
+    # Memoized presentation, keyed on id. Not a mapped column.
+    _serialized_cache: Optional[Tuple[int, BrandPresentation]] = None
 
     @classmethod
     def get(cls, brand_id: int):
@@ -114,10 +304,11 @@ class Brand(db.Model):
         @param brand_id: ID of brand we need.
         @return: Wanted brand.
         """
-        brand: Brand = db.session.query(Brand).filter_by(id=brand_id).first()
+        # Query.get checks the session identity map before touching the DB
+        brand: Brand = db.session.query(Brand).get(brand_id)
 
         if brand is None:
-            raise NotFound([f"Brand[{brand_id}]"])
+            raise NotFound([("Brand", brand_id)])
 
         return brand
 
@@ -125,13 +316,17 @@ class Brand(db.Model):
     def serialized(self) -> BrandPresentation:
         """
         Get brand presentation, prepared to be turned into JSON.
+        Memoized per instance; busted by the `after_update` listener below.
         @return: Brand presentation.
         """
-        return {
-            'id': self.id,
-            'name': self.name,
-            'country_code': self.country_code
-        }
+        cached = self._serialized_cache
+        if cached is not None and cached[0] == self.id:
+            return cached[1]
+
+        presentation = serialize_brand(self)
+
+        self._serialized_cache = (self.id, presentation)
+        return presentation
 
 
 class Category(db.Model):
@@ -143,6 +338,12 @@ class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.Unicode(50), nullable=False)
 
+    products = db.relationship('Product', secondary='products_categories',
+                               back_populates='categories')
+
+    # Memoized presentation, keyed on id. Not a mapped column.
+    _serialized_cache: Optional[Tuple[int, CategoryPresentation]] = None
+
     @classmethod
     def get_all(cls, ids: Set[int]):
         """
@@ -151,27 +352,40 @@ class Category(db.Model):
         @param ids: IDs of wanted Categories.
         @return: Wanted categories.
         """
-        categories = db.session.query(Category).filter(
-            Category.id.in_(ids)
-        ).all()
-
-        db_ids = {record.id for record in categories}
+        id_list = list(ids)
+
+        # id-only projection keeps the existence check off the full rows
+        id_query = bakery(lambda session: session.query(Category.id).filter(
+            Category.id.in_(bindparam('ids', expanding=True))
+        ))
+        db_ids = {
+            category_id for (category_id,) in
+            id_query(db.session()).params(ids=id_list)
+        }
 
-        if len(categories) != len(ids):
-            raise NotFound([f"Category[{category_id}]" for category_id in ids.difference(db_ids)])
+        if db_ids != ids:
+            raise NotFound([("Category", category_id) for category_id in ids.difference(db_ids)])
 
-        return categories
+        row_query = bakery(lambda session: session.query(Category).filter(
+            Category.id.in_(bindparam('ids', expanding=True))
+        ))
+        return row_query(db.session()).params(ids=id_list).all()
 
     @property
     def serialized(self) -> CategoryPresentation:
         """
         Get category presentation, prepared to be turned into JSON.
+        Memoized per instance; busted by the `after_update` listener below.
         @return: Category presentation.
         """
-        return {
-            'id': self.id,
-            'name': self.name,
-        }
+        cached = self._serialized_cache
+        if cached is not None and cached[0] == self.id:
+            return cached[1]
+
+        presentation = serialize_category(self)
+
+        self._serialized_cache = (self.id, presentation)
+        return presentation
 
 
 products_categories = db.Table(
@@ -179,3 +393,52 @@ products_categories = db.Table(
     db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
     db.Column('category_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True)
 )
+
+# Core INSERT for association rows, compiled once and reused by the bulk path.
+_product_category_insert = products_categories.insert()
+
+
+# Monotonically increasing revision of the product tables.
+# Bumped on every flush/rollback touching them, so it can be used as a cache
+# key for anything derived from a whole-table read (see get_products).
+_revision = 0
+
+
+def data_revision() -> int:
+    """
+    Get current revision of the product tables.
+    @return: Revision number, changes whenever products/brands/categories change.
+    """
+    return _revision
+
+
+def bump_data_revision():
+    """
+    Mark the product tables as changed. The flush/rollback listeners below
+    call this automatically; writers that bypass the unit of work (bulk
+    operations, Core inserts) must call it themselves.
+    """
+    global _revision
+    _revision += 1
+
+
+@event.listens_for(Product, 'after_update')
+@event.listens_for(Brand, 'after_update')
+@event.listens_for(Category, 'after_update')
+def _bust_serialized_cache(mapper, connection, target):
+    target._serialized_cache = None
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_revision_on_flush(session, flush_context):
+    touched = session.new | session.dirty | session.deleted
+    if any(isinstance(obj, (Product, Brand, Category)) for obj in touched):
+        bump_data_revision()
+
+
+@event.listens_for(Session, 'after_rollback')
+@event.listens_for(Session, 'after_soft_rollback')
+def _bump_revision_on_rollback(session, *args):
+    # A rollback can revert flushed rows without firing another flush,
+    # so anything keyed on the revision has to be considered stale.
+    bump_data_revision()
@@ -0,0 +1,54 @@
+"""
+Presentation builders for the product models.
+
+The serializer functions are generated at import time from key tuples:
+each one compiles down to a single dict literal with direct attribute
+reads, so the hot GET path pays no per-key loops or property dispatch.
+The `serialized` properties on the models keep their memoization and
+delegate here on a cache miss.
+"""
+
+
+def _compile_serializer(name: str, keys, extra: str = ''):
+    """
+    Build a serializer function for the given key tuple.
+
+    @param name: name of the generated function.
+    @param keys: attribute names copied verbatim into the presentation.
+    @param extra: additional dict-literal entries, appended as source.
+    @return: function mapping a model instance to its presentation dict.
+    """
+    entries = ", ".join(f"'{key}': obj.{key}" for key in keys)
+    if extra:
+        entries = f"{entries}, {extra}"
+
+    namespace = {}
+    exec(f"def {name}(obj): return {{{entries}}}", namespace)
+    return namespace[name]
+
+
+serialize_brand = _compile_serializer(
+    'serialize_brand',
+    ('id', 'name', 'country_code')
+)
+serialize_brand.__doc__ = "Build brand presentation, prepared to be turned into JSON."
+
+serialize_category = _compile_serializer(
+    'serialize_category',
+    ('id', 'name')
+)
+serialize_category.__doc__ = "Build category presentation, prepared to be turned into JSON."
+
+serialize_product = _compile_serializer(
+    'serialize_product',
+    ('id', 'name', 'rating', 'featured', 'items_in_stock', 'receipt_date'),
+    extra="'brand': obj.brand.serialized, "
+          "'categories': [c.serialized for c in obj.categories], "
+          "'expiration_date': obj.expiration_date, "
+          "'created_at': obj.created_at"
+)
+serialize_product.__doc__ = (
+    "Build product presentation, prepared to be turned into JSON. "
+    "Nested brand/category presentations go through their memoized "
+    "`serialized` properties."
+)
@@ -1,16 +1,76 @@
-from datetime import datetime, timedelta
+import re
+from datetime import datetime, timedelta, timezone
 from email import utils as email_utils
 from typing import Optional, Any, TypedDict, List
 
+from flask import g, has_request_context
 from pydantic import BaseModel, constr, confloat, PositiveInt, validator, conset
 
 # Minimal expiration time, 30 days with 5 second as precision
 MINIMAL_EXPIRATION = timedelta(days=30) - timedelta(seconds=5)
 
+# Fast path for the fixed RFC 1123 shape ("Wed, 21 Oct 2015 07:28:00 GMT"),
+# avoiding the generic email.utils parser on every date field.
+_RFC1123_DATETIME = re.compile(
+    r'(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun), '
+    r'(\d{2}) (Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) (\d{4}) '
+    r'(\d{2}):(\d{2}):(\d{2}) (GMT|UT|[+-]\d{4})'
+)
+
+_MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+
+
+def _parse_rfc_1123(date: str) -> Optional[datetime]:
+    """
+    Parse an RFC 1123 formatted date with a single precompiled regex.
+    Mirrors email.utils.parsedate_to_datetime semantics, including the
+    RFC 5322 rule that "-0000" yields a naive datetime.
+
+    @param date: date string
+    @return: datetime object, or None if the string has another shape
+    """
+    match = _RFC1123_DATETIME.fullmatch(date)
+    if match is None:
+        return None
+
+    day, month, year, hour, minute, second, zone = match.groups()
+
+    if zone == '-0000':
+        tz = None
+    elif zone in ('GMT', 'UT', '+0000'):
+        tz = timezone.utc
+    else:
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[3:5]))
+        tz = timezone(offset if zone[0] == '+' else -offset)
+
+    return datetime(int(year), _MONTHS[month], int(day),
+                    int(hour), int(minute), int(second), tzinfo=tz)
+
+
+def _utcnow() -> datetime:
+    """
+    Current UTC time, read once per request.
+    Inside a request this reuses the timestamp stamped on flask.g by the
+    app factory's before_request hook; outside one it falls back to the
+    system clock.
+
+    @return: current UTC datetime
+    """
+    if has_request_context():
+        request_now = g.get('request_now')
+        if request_now is not None:
+            return request_now
+    return datetime.utcnow()
+
+
 Name = constr(max_length=50)
 Rating = confloat(ge=0, le=10)
 CategoryID = int
 BrandID = int
+CategorySet = conset(CategoryID, min_items=1, max_items=5)
 
 
 class ProductUpdateRequest(BaseModel):
@@ -25,7 +85,7 @@ class ProductUpdateRequest(BaseModel):
     expiration_date: Optional[datetime]
 
     brand: Optional[BrandID]
-    categories: Optional[conset(CategoryID, min_items=1, max_items=5)]
+    categories: Optional[CategorySet]
 
     items_in_stock: Optional[PositiveInt]
 
@@ -37,7 +97,15 @@ class ProductUpdateRequest(BaseModel):
         @return: datetime object or string (if unable to parse as RFC 1123 formatted string)
         """
         if isinstance(date, str):
-            parsed_datetime = email_utils.parsedate_to_datetime(date)
+            parsed_datetime = _parse_rfc_1123(date)
+            if parsed_datetime is not None:
+                return parsed_datetime
+
+            # fall back to the tolerant stdlib parser for other RFC 2822 spellings
+            try:
+                parsed_datetime = email_utils.parsedate_to_datetime(date)
+            except ValueError:
+                return date
             if parsed_datetime is None:
                 return date
             return parsed_datetime
@@ -54,7 +122,7 @@ class ProductUpdateRequest(BaseModel):
         """
 
         if isinstance(expiration_date, datetime):
-            today = datetime.utcnow()
+            today = _utcnow()
             time_to_expire = expiration_date - today
             if time_to_expire < MINIMAL_EXPIRATION:
                 raise ValueError(f"can't set expiration in less then {MINIMAL_EXPIRATION} days")
@@ -71,7 +139,7 @@ class ProductCreateRequest(ProductUpdateRequest):
     rating: Rating
 
     brand: BrandID
-    categories: conset(CategoryID, min_items=1, max_items=5)
+    categories: CategorySet
 
     items_in_stock: PositiveInt
 
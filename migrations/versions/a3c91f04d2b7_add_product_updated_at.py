@@ -0,0 +1,29 @@
+"""add products.updated_at
+
+Revision ID: a3c91f04d2b7
+Revises: 75a6545b696a
+Create Date: 2026-09-01 10:12:03.481920
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a3c91f04d2b7'
+down_revision = '75a6545b696a'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('products', sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # backfill existing rows before tightening the constraint
+    op.execute('UPDATE products SET updated_at = created_at')
+
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_column('updated_at')
